@@ -72,6 +72,44 @@ def transfer_funds(sender, recipient, amount):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def transfer_funds_batch(transfers):
+    """Transfer funds for a batch of transfers, sequenced into a single block"""
+    try:
+        if not isinstance(transfers, list) or not transfers:
+            return jsonify({'error': 'Transfers must be a non-empty list'}), 400
+        
+        batch = []
+        for transfer in transfers:
+            if not isinstance(transfer, dict):
+                return jsonify({'error': 'Invalid transfer'}), 400
+            sender = transfer.get('sender')
+            recipient = transfer.get('recipient')
+            amount = transfer.get('amount')
+            if not sender or not recipient or not amount:
+                return jsonify({'error': 'Missing required fields'}), 400
+            try:
+                amount = float(amount)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid amount'}), 400
+            batch.append((sender, recipient, amount))
+        
+        # Validate the whole batch at once (across all shards when sharding is enabled)
+        blockchain = get_blockchain()
+        results, block_index = blockchain.add_transactions(batch)
+        
+        return jsonify({
+            'results': [
+                {'sender': sender, 'recipient': recipient, 'amount': amount,
+                 'success': success, 'message': message}
+                for (sender, recipient, amount), (success, message) in zip(batch, results)
+            ],
+            'accepted': sum(1 for success, _ in results if success),
+            'block_index': block_index
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 def get_user_balance(username):
     """Get user balance from blockchain"""
     try:
@@ -0,0 +1,149 @@
+"""
+Benchmark transfer throughput of the sharded token economy against TokenEconomy
+
+Usage: python bench_sharding.py [--accounts N] [--transfers N] [--batch N] [--shards 2,4,8]
+
+For the unsharded TokenEconomy and each shard count three numbers are reported:
+  validate  transfer validation only (persistence disabled)
+  persist   validation plus balance persistence (one write per batch, per
+            shard for the sharded economy)
+  chain     end to end through Blockchain.add_transactions (adds proof of work
+            and the blockchain.json write for every batch)
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from blockchain.blockchain import Blockchain
+from blockchain.sharded_economy import ShardedTokenEconomy
+from blockchain.token_economy import TokenEconomy
+
+
+def seed_balances(data_dir, accounts):
+    """Write a balances file with every account holding the initial balance"""
+    total_distributed = len(accounts) * TokenEconomy.INITIAL_USER_BALANCE
+    balances = {TokenEconomy.NETWORK_ADDRESS: TokenEconomy.TOTAL_SUPPLY - total_distributed}
+    balances.update({account: TokenEconomy.INITIAL_USER_BALANCE for account in accounts})
+
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, "balances.json"), 'w', encoding='utf-8') as f:
+        json.dump({'balances': balances, 'total_distributed': total_distributed}, f)
+
+
+def total_balance(economy):
+    if isinstance(economy, ShardedTokenEconomy):
+        return economy.get_total_balance()
+    return sum(economy.balances.values())
+
+
+def close(economy):
+    if isinstance(economy, ShardedTokenEconomy):
+        economy.close()
+
+
+def run_batches(submit, transfers, batch_size):
+    """Submit transfers in batches; returns (transfers per second, accepted count)"""
+    accepted = 0
+    started = time.perf_counter()
+    for start in range(0, len(transfers), batch_size):
+        results = submit(transfers[start:start + batch_size])
+        accepted += sum(1 for success, _ in results if success)
+    return len(transfers) / (time.perf_counter() - started), accepted
+
+
+def run_economy(num_shards, accounts, transfers, batch_size, persist):
+    """Run the workload directly against the token economy"""
+    data_dir = tempfile.mkdtemp(prefix="bench_shards_")
+    try:
+        seed_balances(data_dir, accounts)
+        if num_shards:
+            economy = ShardedTokenEconomy(data_dir, num_shards, persist=persist)
+        else:
+            economy = TokenEconomy(data_dir, persist=persist)
+
+        throughput, accepted = run_batches(economy.transfer_batch, transfers, batch_size)
+        conserved = math.isclose(total_balance(economy), TokenEconomy.TOTAL_SUPPLY, abs_tol=1e-6)
+        close(economy)
+        return throughput, accepted, conserved
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def run_chain(num_shards, accounts, transfers, batch_size):
+    """Run the workload through the sequencer (Blockchain.add_transactions)"""
+    work_dir = tempfile.mkdtemp(prefix="bench_chain_")
+    cwd = os.getcwd()
+    try:
+        # Blockchain keeps its data in ./data
+        os.chdir(work_dir)
+        seed_balances("data", accounts)
+        blockchain = Blockchain(shards=num_shards or 1)
+
+        throughput, accepted = run_batches(lambda batch: blockchain.add_transactions(batch)[0],
+                                           transfers, batch_size)
+        conserved = math.isclose(total_balance(blockchain.token_economy),
+                                 TokenEconomy.TOTAL_SUPPLY, abs_tol=1e-6)
+        close(blockchain.token_economy)
+        return throughput, accepted, conserved
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=5000)
+    parser.add_argument('--transfers', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--shards', default="2,4,8")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    accounts = [f"user{i}" for i in range(args.accounts)]
+    # Whole-token amounts keep the supply check exact in floating point
+    transfers = [(rng.choice(accounts), rng.choice(accounts), float(rng.randint(1, 5)))
+                 for _ in range(args.transfers)]
+
+    print(f"{args.transfers} transfers over {args.accounts} accounts, batches of {args.batch}, "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'economy':>10} {'validate/s':>11} {'persist/s':>10} {'chain/s':>8} "
+          f"{'vs unsharded':>12} {'accepted':>9} {'checks ok':>9}")
+
+    baseline = expected = None
+    best = {'validate': 0.0, 'persist': 0.0}
+    unsharded = {}
+    for num_shards in [0] + [int(n) for n in args.shards.split(',')]:
+        validate, accepted, conserved = run_economy(num_shards, accounts, transfers, args.batch, False)
+        persist, _, persist_conserved = run_economy(num_shards, accounts, transfers, args.batch, True)
+        chain, _, chain_conserved = run_chain(num_shards, accounts, transfers, args.batch)
+        baseline = baseline or validate
+        if num_shards:
+            best = {'validate': max(best['validate'], validate), 'persist': max(best['persist'], persist)}
+        else:
+            unsharded = {'validate': validate, 'persist': persist}
+        expected = accepted if expected is None else expected
+
+        label = f"{num_shards} shards" if num_shards else "unsharded"
+        # Sharding must not change which transfers are accepted
+        ok = conserved and persist_conserved and chain_conserved and accepted == expected
+        print(f"{label:>10} {validate:>11.0f} {persist:>10.0f} {chain:>8.0f} "
+              f"{validate / baseline:>11.2f}x {accepted:>9} {str(ok):>9}")
+
+    print()
+    for measure in ('validate', 'persist'):
+        if best[measure] > unsharded[measure]:
+            print(f"{measure}: best shard count is {best[measure] / unsharded[measure]:.2f}x unsharded")
+        else:
+            print(f"{measure}: sharding does not scale, best shard count is "
+                  f"{best[measure] / unsharded[measure]:.2f}x unsharded")
+    if best['validate'] <= unsharded['validate']:
+        print("The coordinator routes, pickles and sends every transfer serially, which costs more")
+        print("than validating it in process, so adding shards cannot speed up validation.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import bisect
+import hashlib
+import json
+import lzma
+import os
+import time
+import zlib
+
+
+class BlockArchive:
+    """
+    Compressed archive for old, sealed blocks
+    Blocks are rolled into immutable segments (zlib or lzma) that carry a
+    per-segment offset index, so a single block can be read back without
+    parsing the rest of its segment
+    """
+
+    CODECS = {
+        'zlib': ('zlib', lambda data: zlib.compress(data, 9), zlib.decompress),
+        'lzma': ('xz', lzma.compress, lzma.decompress),
+    }
+    DEFAULT_SEGMENT_SIZE = 1000
+    DEFAULT_KEEP_RECENT = 1000
+
+    def __init__(self, data_dir="data", hash_block=None):
+        self.archive_dir = os.path.join(data_dir, "archive")
+        self.index_file = os.path.join(self.archive_dir, "index.json")
+        self.hash_block = hash_block
+
+        # Ensure archive directory exists
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        # Segments are immutable, so decoded blocks can be cached by file name
+        self._blocks_cache = {}
+        self._payload_cache = (None, None)
+
+        # Load segment index
+        self._index_signature = None
+        self.segments = self.load_index()
+
+    def segment_files(self):
+        """Names of the segment files on disk, oldest first"""
+        extensions = tuple('.' + extension for extension, _, _ in self.CODECS.values())
+        return sorted(name for name in os.listdir(self.archive_dir)
+                      if name.startswith("segment_") and name.endswith(extensions))
+
+    def _stat_index(self):
+        """Identify the current on-disk index (None if there is none)"""
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        """Reload the segment index if another instance changed it on disk"""
+        if self._stat_index() != self._index_signature:
+            self.segments = self.load_index()
+
+    def load_index(self):
+        """Load segment index from JSON file, rebuilding it from the segment files if needed"""
+        if os.path.exists(self.index_file):
+            try:
+                signature = self._stat_index()
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    segments = json.load(f)['segments']
+                self._index_signature = signature
+                return segments
+            except (json.JSONDecodeError, KeyError, TypeError):
+                print("Archive index is corrupt, rebuilding it from segment files")
+        elif not self.segment_files():
+            self._index_signature = None
+            return []
+
+        self.segments = self.rebuild_index()
+        self.save_index()
+        return self.segments
+
+    def rebuild_index(self):
+        """Recreate the segment index by scanning and verifying every segment file"""
+        if self.hash_block is None:
+            raise ValueError("Cannot rebuild archive index without a block hash function")
+
+        codecs = {extension: codec for codec, (extension, _, _) in self.CODECS.items()}
+        decoder = json.JSONDecoder()
+        segments = []
+        previous_hash = None
+
+        for name in self.segment_files():
+            codec = codecs[name.rsplit('.', 1)[1]]
+            with open(os.path.join(self.archive_dir, name), 'rb') as f:
+                data = f.read()
+            try:
+                text = self.CODECS[codec][2](data).decode('utf-8')
+            except (zlib.error, lzma.LZMAError, UnicodeDecodeError) as e:
+                raise ValueError(f"Archive segment {name} is unreadable: {e}")
+
+            blocks, offsets = [], []
+            position = byte_offset = 0
+            while position < len(text):
+                block, end = decoder.raw_decode(text, position)
+                length = len(text[position:end].encode('utf-8'))
+                blocks.append(block)
+                offsets.append([byte_offset, length])
+                byte_offset += length
+                position = end
+
+            # Segments must extend the archive contiguously and stay hash-linked
+            expected_start = segments[-1]['end_index'] + 1 if segments else 1
+            if not blocks or blocks[0]['index'] != expected_start:
+                raise ValueError(f"Archive segment {name} does not start at block {expected_start}")
+            for position, block in enumerate(blocks):
+                if block['index'] != expected_start + position:
+                    raise ValueError(f"Archive segment {name} is not contiguous")
+                if previous_hash is not None and block['previous_hash'] != previous_hash:
+                    raise ValueError(f"Archive segment {name} breaks the chain at block {block['index']}")
+                previous_hash = self.hash_block(block)
+
+            segments.append({
+                'file': name,
+                'codec': codec,
+                'start_index': blocks[0]['index'],
+                'end_index': blocks[-1]['index'],
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'raw_size': byte_offset,
+                'compressed_size': len(data),
+                'offsets': offsets,
+                'block_hashes': [self.hash_block(block) for block in blocks],
+            })
+            self._blocks_cache[name] = blocks
+
+        return segments
+
+    def _fsync_dir(self):
+        """Make renames inside the archive directory durable"""
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.archive_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _replace_index(self, segments):
+        """Atomically swap in a new index file"""
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'segments': segments}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+        self._index_signature = self._stat_index()
+
+    def save_index(self, segments=None):
+        """Atomically and durably save segment index to JSON file"""
+        self._replace_index(self.segments if segments is None else segments)
+        self._fsync_dir()
+
+    @property
+    def last_index(self):
+        """Index of the newest archived block (0 if nothing is archived)"""
+        return self.segments[-1]['end_index'] if self.segments else 0
+
+    def size_on_disk(self):
+        """Total bytes used by the archive (segments and index)"""
+        total = 0
+        for name in os.listdir(self.archive_dir):
+            total += os.path.getsize(os.path.join(self.archive_dir, name))
+        return total
+
+    def _read_payload(self, segment):
+        """Read and decompress a segment file"""
+        name = segment['file']
+        if self._payload_cache[0] == name:
+            return self._payload_cache[1]
+
+        with open(os.path.join(self.archive_dir, name), 'rb') as f:
+            data = f.read()
+
+        decompress = self.CODECS[segment['codec']][2]
+        payload = decompress(data)
+        self._payload_cache = (name, payload)
+        return payload
+
+    def clear_cache(self):
+        """Drop decoded segments held in memory"""
+        self._blocks_cache = {}
+        self._payload_cache = (None, None)
+
+    def load_blocks(self):
+        """Return every archived block, oldest first"""
+        blocks = []
+        for segment in self.segments:
+            cached = self._blocks_cache.get(segment['file'])
+            if cached is None:
+                payload = self._read_payload(segment)
+                cached = [json.loads(payload[offset:offset + length].decode('utf-8'))
+                          for offset, length in segment['offsets']]
+                self._blocks_cache[segment['file']] = cached
+            blocks.extend(cached)
+        return blocks
+
+    def get_block(self, index):
+        """Read a single archived block by its index using the offset index"""
+        starts = [segment['start_index'] for segment in self.segments]
+        position = bisect.bisect_right(starts, index) - 1
+        if position < 0 or index > self.segments[position]['end_index']:
+            return None
+
+        segment = self.segments[position]
+        offset, length = segment['offsets'][index - segment['start_index']]
+        payload = self._read_payload(segment)
+        return json.loads(payload[offset:offset + length].decode('utf-8'))
+
+    def verify_segment(self, segment):
+        """Check a segment file against its stored checksum and block hashes"""
+        path = os.path.join(self.archive_dir, segment['file'])
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        if hashlib.sha256(data).hexdigest() != segment['sha256']:
+            return False
+
+        try:
+            payload = self.CODECS[segment['codec']][2](data)
+        except (zlib.error, lzma.LZMAError):
+            return False
+
+        for (offset, length), expected in zip(segment['offsets'], segment['block_hashes']):
+            block = json.loads(payload[offset:offset + length].decode('utf-8'))
+            if self.hash_block(block) != expected:
+                return False
+
+        return len(segment['offsets']) == segment['end_index'] - segment['start_index'] + 1
+
+    def write_segment(self, blocks, codec='zlib'):
+        """Compress a contiguous range of blocks into a new segment file"""
+        extension, compress, _ = self.CODECS[codec]
+
+        payload = bytearray()
+        offsets = []
+        for block in blocks:
+            encoded = json.dumps(block, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            offsets.append([len(payload), len(encoded)])
+            payload.extend(encoded)
+
+        data = compress(bytes(payload))
+        start_index = blocks[0]['index']
+        end_index = blocks[-1]['index']
+        name = f"segment_{start_index:08d}_{end_index:08d}.{extension}"
+
+        tmp_path = os.path.join(self.archive_dir, name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        path = os.path.join(self.archive_dir, name)
+        os.replace(tmp_path, path)
+        try:
+            self._fsync_dir()
+        except Exception:
+            os.remove(path)
+            raise
+
+        return {
+            'file': name,
+            'codec': codec,
+            'start_index': start_index,
+            'end_index': end_index,
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'raw_size': len(payload),
+            'compressed_size': len(data),
+            'offsets': offsets,
+            'block_hashes': [self.hash_block(block) for block in blocks],
+        }
+
+    def compact(self, chain, segment_size=DEFAULT_SEGMENT_SIZE,
+                keep_recent=DEFAULT_KEEP_RECENT, codec='zlib'):
+        """
+        Roll sealed ranges of old blocks into new segments
+        Only full ranges of segment_size blocks older than the newest
+        keep_recent blocks are archived. Each segment is verified before the
+        index is durably updated; returns the list of new segments
+        """
+        if segment_size <= 0:
+            raise ValueError("Segment size must be positive")
+        if keep_recent < 0:
+            raise ValueError("keep_recent cannot be negative")
+        if codec not in self.CODECS:
+            raise ValueError(f"Unsupported codec: {codec}")
+
+        new_segments = []
+        start = self.last_index
+        indexed = False
+        try:
+            while len(chain) - keep_recent - start >= segment_size:
+                segment = self.write_segment(chain[start:start + segment_size], codec)
+                new_segments.append(segment)
+
+                if not self.verify_segment(segment):
+                    raise ValueError(f"Segment verification failed: {segment['file']}")
+                start += segment_size
+
+            if new_segments:
+                self._replace_index(self.segments + new_segments)
+                indexed = True
+                self._fsync_dir()
+        except Exception:
+            # Leave no orphan segments behind, but never remove segments the index already lists
+            if not indexed:
+                for segment in new_segments:
+                    path = os.path.join(self.archive_dir, segment['file'])
+                    if os.path.exists(path):
+                        os.remove(path)
+            raise
+        finally:
+            if indexed:
+                for segment in new_segments:
+                    self._blocks_cache[segment['file']] = chain[segment['start_index'] - 1:segment['end_index']]
+                self.segments.extend(new_segments)
+
+        return new_segments
+
+    def measure_read_latency(self, segments):
+        """Time block reads from the given segments, in milliseconds"""
+        cold, warm = [], []
+        for segment in segments:
+            self._payload_cache = (None, None)
+            for index in range(segment['start_index'], segment['end_index'] + 1):
+                started = time.perf_counter()
+                self.get_block(index)
+                elapsed = (time.perf_counter() - started) * 1000
+                (cold if index == segment['start_index'] else warm).append(elapsed)
+
+        def average(values):
+            return sum(values) / len(values) if values else 0.0
+
+        return {
+            'cold_read_ms': average(cold),
+            'warm_read_ms': average(warm),
+            'max_read_ms': max(cold + warm, default=0.0),
+        }
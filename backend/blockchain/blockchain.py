@@ -1,18 +1,28 @@
 import hashlib
 import json
 import os
+from .archive import BlockArchive
+from .sharded_economy import ShardedTokenEconomy
 from .token_economy import TokenEconomy
 
 class Blockchain:
-    def __init__(self):
+    def __init__(self, shards=None):
         self.data_dir = "data"
         self.blockchain_file = os.path.join(self.data_dir, "blockchain.json")
         
         # Ensure data directory exists
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Initialize token economy
-        self.token_economy = TokenEconomy()
+        # Initialize token economy (sharded across worker processes when shards > 1)
+        if shards is None:
+            shards = int(os.environ.get('BLOCKCHAIN_SHARDS', 1))
+        if shards > 1:
+            self.token_economy = ShardedTokenEconomy(self.data_dir, shards)
+        else:
+            self.token_economy = TokenEconomy(self.data_dir)
+        
+        # Compressed archive holding old, sealed blocks
+        self.archive = BlockArchive(self.data_dir, self.hash)
         
         # Load existing blockchain or create new
         self.chain, self.current_transactions = self.load_blockchain()
@@ -21,29 +31,56 @@ class Blockchain:
         if not self.chain:
             self.create_block(previous_hash='1', proof=100)
 
+    def start(self):
+        """Start background workers (sharded token economy) before serving requests"""
+        if isinstance(self.token_economy, ShardedTokenEconomy):
+            self.token_economy.start()
+
     def load_blockchain(self):
-        """Load blockchain from JSON file"""
+        """Load blockchain from the archive and JSON file"""
+        # Another instance may have compacted since this one last looked
+        self.archive.refresh()
+        archived = self.archive.load_blocks()
+        last_archived = self.archive.last_index
+        
         if os.path.exists(self.blockchain_file):
             try:
                 with open(self.blockchain_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    chain = data.get('chain', [])
+                    # Skip blocks already archived (compaction may have stopped before rewriting the file)
+                    chain = [block for block in data.get('chain', []) if block['index'] > last_archived]
                     current_transactions = data.get('current_transactions', [])
-                    return chain, current_transactions
             except (json.JSONDecodeError, FileNotFoundError):
-                pass
+                chain, current_transactions = [], []
+        else:
+            chain, current_transactions = [], []
         
-        return [], []
+        # The hot chain must continue exactly where the archive stops
+        if chain and chain[0]['index'] != last_archived + 1:
+            raise ValueError(
+                f"Blockchain file starts at block {chain[0]['index']}, "
+                f"expected {last_archived + 1} after the archive"
+            )
+        
+        return archived + chain, current_transactions
 
     def save_blockchain(self):
         """Save blockchain to JSON file"""
         try:
+            # Slice against the on-disk archive, which another instance may have extended
+            self.archive.refresh()
             data = {
-                'chain': self.chain,
+                # Archived blocks live in compressed segments
+                'chain': self.chain[self.archive.last_index:],
                 'current_transactions': self.current_transactions
             }
-            with open(self.blockchain_file, 'w', encoding='utf-8') as f:
+            # Write atomically: compaction relies on this file to drop archived blocks
+            tmp_file = self.blockchain_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.blockchain_file)
         except Exception as e:
             print(f"Error saving blockchain: {e}")
 
@@ -63,6 +100,36 @@ class Blockchain:
         
         return block
 
+    def compact_archive(self, segment_size=BlockArchive.DEFAULT_SEGMENT_SIZE,
+                        keep_recent=BlockArchive.DEFAULT_KEEP_RECENT, codec='zlib'):
+        """Move sealed ranges of old blocks into compressed archive segments"""
+        def disk_usage():
+            size = self.archive.size_on_disk()
+            if os.path.exists(self.blockchain_file):
+                size += os.path.getsize(self.blockchain_file)
+            return size
+        
+        size_before = disk_usage()
+        
+        # Segments are verified before the originals are dropped from the JSON file
+        new_segments = self.archive.compact(self.chain, segment_size, keep_recent, codec)
+        if new_segments:
+            self.save_blockchain()
+        
+        size_after = disk_usage()
+        
+        report = {
+            'segments_created': len(new_segments),
+            'blocks_archived': sum(s['end_index'] - s['start_index'] + 1 for s in new_segments),
+            'total_archived_blocks': self.archive.last_index,
+            'codec': codec,
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+            'bytes_reclaimed': size_before - size_after,
+        }
+        report.update(self.archive.measure_read_latency(new_segments))
+        return report
+
     def get_current_timestamp(self):
         from time import time
         return time()
@@ -73,6 +140,16 @@ class Blockchain:
         transaction_string = f"{sender}{recipient}{amount}{self.get_current_timestamp()}"
         return hashlib.sha256(transaction_string.encode()).hexdigest()
 
+    def new_transaction(self, sender, recipient, amount):
+        """Build a transaction record"""
+        return {
+            'sender': sender,
+            'recipient': recipient,
+            'amount': amount,
+            'timestamp': self.get_current_timestamp(),
+            'hash': self.generate_transaction_hash(sender, recipient, amount)
+        }
+
     def add_transaction(self, sender, recipient, amount):
         """Add a validated transaction to the blockchain and immediately mine it"""
         # Validate transaction through token economy
@@ -81,16 +158,8 @@ class Blockchain:
         if not success:
             return False, message
         
-        transaction = {
-            'sender': sender,
-            'recipient': recipient,
-            'amount': amount,
-            'timestamp': self.get_current_timestamp(),
-            'hash': self.generate_transaction_hash(sender, recipient, amount)
-        }
-        
         # Add transaction to pending list
-        self.current_transactions.append(transaction)
+        self.current_transactions.append(self.new_transaction(sender, recipient, amount))
         
         # Immediately mine the transaction into a new block
         last_block = self.last_block
@@ -103,6 +172,18 @@ class Blockchain:
         
         return True, new_block['index']
 
+    def add_transactions(self, transfers):
+        """Validate a batch of (sender, recipient, amount) transfers and mine the valid ones into one block"""
+        results = self.token_economy.transfer_batch(transfers)
+        
+        # Keep the submission order when sequencing transactions into the block
+        for (sender, recipient, amount), (success, _) in zip(transfers, results):
+            if success:
+                self.current_transactions.append(self.new_transaction(sender, recipient, amount))
+        
+        block, _ = self.mine_block()
+        return results, block['index'] if block else None
+
     def create_user_account(self, username):
         """Create a new user account with initial balance"""
         return self.token_economy.create_user_account(username)
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SHARD_FILE = re.compile(r"shard_(\d+)\.json$")
+META_FILE = "meta.json"
+DECISION_FILE = "decision.json"
+LOCK_FILE = "shards.lock"
+
+
+def acquire_shard_lock(data_dir):
+    """
+    Take the exclusive lock guarding a data directory's shard state
+    Raises RuntimeError if another economy (in this or another process) holds it
+    """
+    f = open(os.path.join(data_dir, LOCK_FILE), 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise RuntimeError(f"Shard state in {data_dir} is in use by another token economy")
+    return f
+
+
+def release_shard_lock(lock):
+    """Release a lock taken with acquire_shard_lock"""
+    lock.close()
+
+
+def write_json_atomic(path, data, sync=True, indent=None):
+    """Write JSON through a temporary file and rename it into place"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def has_shard_state(shards_dir):
+    """Whether a sharded run left state behind in shards_dir"""
+    if not os.path.isdir(shards_dir):
+        return False
+    return any(SHARD_FILE.match(name) or name in (META_FILE, DECISION_FILE)
+               for name in os.listdir(shards_dir))
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Corrupt shard state file {path}: {e}")
+
+
+def recover_shard_state(shards_dir, balances, total_distributed):
+    """
+    Overlay the state of a sharded run on top of balances.json
+    Shard files are authoritative for the accounts they hold. Logged
+    cross-shard commit decisions are replayed on every shard that had not yet
+    persisted them, so a crash during phase two keeps the supply conserved
+    """
+    if not os.path.isdir(shards_dir):
+        return balances, total_distributed
+
+    applied = {}
+    for name in sorted(os.listdir(shards_dir)):
+        match = SHARD_FILE.match(name)
+        if match:
+            data = _read_json(os.path.join(shards_dir, name))
+            balances.update(data.get('balances', {}))
+            applied[int(match.group(1))] = data.get('decision_id', 0)
+
+    meta_path = os.path.join(shards_dir, META_FILE)
+    if os.path.exists(meta_path):
+        total_distributed = _read_json(meta_path).get('total_distributed', total_distributed)
+
+    decision_path = os.path.join(shards_dir, DECISION_FILE)
+    if os.path.exists(decision_path):
+        for decision in _read_json(decision_path)['decisions']:
+            for sender_shard, sender, recipient_shard, recipient, amount in decision['commits']:
+                if applied.get(sender_shard, 0) < decision['id']:
+                    balances[sender] = balances.get(sender, 0.0) - amount
+                if applied.get(recipient_shard, 0) < decision['id']:
+                    balances[recipient] = balances.get(recipient, 0.0) + amount
+
+    return balances, total_distributed
+
+
+def clear_shard_state(shards_dir):
+    """Remove shard state once it has been merged into balances.json"""
+    if not os.path.isdir(shards_dir):
+        return
+    for name in os.listdir(shards_dir):
+        os.remove(os.path.join(shards_dir, name))
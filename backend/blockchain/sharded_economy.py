@@ -0,0 +1,536 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+from .shard_store import (DECISION_FILE, META_FILE, acquire_shard_lock, clear_shard_state,
+                          release_shard_lock, write_json_atomic)
+from .token_economy import TokenEconomy
+
+
+def shard_for(account, num_shards):
+    """Map an account to a shard using a stable hash of its name"""
+    digest = hashlib.sha256(account.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+
+def _importing_main_in_child():
+    """
+    Whether a spawned (or forkserver) worker is still re-importing the main
+    module; this is the check multiprocessing itself uses
+    """
+    return getattr(multiprocessing.current_process(), '_inheriting', False)
+
+
+def _shard_worker(conn, shard_file, balances, network_address, persist):
+    """
+    Worker process owning one partition of the balances
+    Receives batches of operations, applies them in order and persists the
+    partition once per batch before replying. If that write fails, the
+    batch's transfers and prepares are rolled back and reported as failed;
+    commits cannot be undone, so they stay pending until a later write
+    succeeds. Replies are (results, last persisted decision id, error).
+    """
+    decision_id = 0            # last cross-shard commit decision applied here
+    persisted_decision_id = 0  # last decision included in a successful write
+    dirty = False              # memory holds changes the shard file does not
+    held = {}                  # txid -> (account, amount) reserved by prepare_debit
+    held_by_account = {}       # account -> total amount currently reserved
+    pending_credits = {}       # txid -> (account, create)
+    reserved_names = set()
+
+    def available(account):
+        return balances[account] - held_by_account.get(account, 0.0)
+
+    def hold(txid, account, amount):
+        held[txid] = (account, amount)
+        held_by_account[account] = held_by_account.get(account, 0.0) + amount
+
+    def release(txid):
+        account, amount = held.pop(txid)
+        held_by_account[account] -= amount
+        if held_by_account[account] <= 1e-9:
+            del held_by_account[account]
+        return account, amount
+
+    def forget_credit(txid):
+        account, create = pending_credits.pop(txid)
+        reserved_names.discard(account)
+        return account, create
+
+    def save():
+        write_json_atomic(shard_file, {'balances': balances, 'decision_id': decision_id})
+
+    def apply(op):
+        """Apply one operation; returns (result, mutated, undo)"""
+        nonlocal decision_id
+        kind = op[0]
+
+        if kind == 'decide':
+            decision_id = op[1]
+            return (True, "Decided"), True, None
+
+        if kind == 'transfer':
+            _, sender, recipient, amount, create = op
+            if create and (recipient in balances or recipient in reserved_names):
+                return (False, "User already exists"), False, None
+            if sender not in balances:
+                return (False, "Sender account not found"), False, None
+            if not create and recipient not in balances:
+                return (False, "Recipient account not found"), False, None
+            if available(sender) < amount:
+                return (False, "Insufficient funds"), False, None
+            if amount <= 0:
+                return (False, "Amount must be positive"), False, None
+            created = recipient not in balances
+            balances[sender] -= amount
+            balances[recipient] = balances.get(recipient, 0.0) + amount
+
+            def undo():
+                balances[sender] += amount
+                if created:
+                    del balances[recipient]
+                else:
+                    balances[recipient] -= amount
+            return (True, "Transfer successful"), True, undo
+
+        if kind == 'prepare_debit':
+            _, txid, account, amount = op
+            if account not in balances:
+                return (False, "Sender account not found"), False, None
+            if available(account) < amount:
+                return (False, "Insufficient funds"), False, None
+            if amount <= 0:
+                return (False, "Amount must be positive"), False, None
+            hold(txid, account, amount)
+            return (True, "Prepared"), False, lambda: release(txid)
+
+        if kind == 'prepare_credit':
+            _, txid, account, create = op
+            if create:
+                if account in balances or account in reserved_names:
+                    return (False, "User already exists"), False, None
+                reserved_names.add(account)
+            elif account not in balances:
+                return (False, "Recipient account not found"), False, None
+            pending_credits[txid] = (account, create)
+            return (True, "Prepared"), False, lambda: forget_credit(txid)
+
+        if kind == 'commit_debit':
+            account, amount = release(op[1])
+            balances[account] -= amount
+            return (True, "Committed"), True, None
+
+        if kind == 'abort_debit':
+            release(op[1])
+            return (True, "Aborted"), False, None
+
+        if kind == 'commit_credit':
+            _, txid, amount = op
+            account, create = forget_credit(txid)
+            balances[account] = balances.get(account, 0.0) + amount
+            return (True, "Committed"), True, None
+
+        if kind == 'abort_credit':
+            forget_credit(op[1])
+            return (True, "Aborted"), False, None
+
+        if kind == 'balance':
+            return balances.get(op[1], 0.0), False, None
+
+        if kind == 'stats':
+            accounts = len([b for b in balances.keys() if b != network_address])
+            return (accounts, balances.get(network_address)), False, None
+
+        if kind == 'snapshot':
+            return dict(balances), False, None
+
+        raise ValueError(f"Unknown shard operation: {kind}")
+
+    # Forked workers inherit each other's pipe ends, so neither EOF nor the parent
+    # sentinel reveals a dead coordinator; being re-parented does
+    coordinator_pid = os.getppid()
+    while True:
+        if not conn.poll(1.0):
+            if os.getppid() != coordinator_pid:
+                break
+            continue
+        command, ops = conn.recv()
+        if command == 'stop':
+            conn.send(None)
+            break
+
+        results = []
+        undo_log = []
+        changed = False
+        for position, op in enumerate(ops):
+            # One bad operation must not take the whole shard down
+            try:
+                result, mutated, undo = apply(op)
+            except Exception as e:
+                result, mutated, undo = (False, f"Shard error: {e!r}"), False, None
+            results.append(result)
+            changed = changed or mutated
+            if undo is not None:
+                undo_log.append((position, undo))
+
+        # Group commit: the batch is durable before any result is returned
+        error = None
+        if persist and (changed or dirty):
+            try:
+                save()
+                dirty = False
+                persisted_decision_id = decision_id
+            except Exception as e:
+                error = f"Shard could not persist its balances: {e}"
+                # Memory still matches disk for everything except this batch and earlier commits
+                for position, undo in reversed(undo_log):
+                    undo()
+                    results[position] = (False, error)
+                dirty = dirty or any(op[0] in ('commit_debit', 'commit_credit', 'decide') for op in ops)
+        elif not persist:
+            persisted_decision_id = decision_id
+        conn.send((results, persisted_decision_id, error))
+
+    conn.close()
+
+
+class ShardedTokenEconomy(TokenEconomy):
+    """
+    Token economy with balances partitioned across worker processes
+    Accounts are assigned to shards by account hash. Same-shard transfers are
+    applied by a single worker; cross-shard transfers use a two-phase
+    debit/credit protocol coordinated by this (single) sequencer process.
+    All shard I/O is serialized by a lock, so the economy can be shared by
+    the threads of a Flask server.
+
+    Workers use the platform's default start method and are started on
+    first use (or by an explicit start()), so an economy that is only
+    constructed, such as in the debug reloader's watcher process or while a
+    spawned worker re-imports the main module, never starts workers. A
+    running economy holds an exclusive lock on the data directory's shard
+    state, and a second economy on the same directory refuses to start.
+
+    Every transfer is routed, pickled and sent to its shards by the
+    coordinator, one after another. That per-transfer cost is higher than
+    validating the transfer in process, so this design does not make
+    validation faster than TokenEconomy (see bench_sharding.py)
+    """
+
+    def __init__(self, data_dir="data", num_shards=4, persist=True):
+        if num_shards < 1:
+            raise ValueError("Number of shards must be at least 1")
+
+        self.data_dir = data_dir
+        self.num_shards = num_shards
+        self.persist = persist
+        self.balances_file = os.path.join(self.data_dir, "balances.json")
+        self.shards_dir = os.path.join(self.data_dir, "shards")
+        self.meta_file = os.path.join(self.shards_dir, META_FILE)
+        self.decision_file = os.path.join(self.shards_dir, DECISION_FILE)
+
+        # Ensure data directories exist
+        os.makedirs(self.shards_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._shard_lock = None
+        self.connections = []
+        self.workers = []
+        self.started = False
+        self.closed = False
+        self._txid = 0
+        self._decision_id = 0
+        self._persisted = [0] * num_shards  # last decision each shard has written to disk
+        self._pending_decisions = []        # logged decisions some shard has not yet persisted
+
+    def start(self):
+        """Consolidate state left by a previous run and start one worker per shard"""
+        with self._lock:
+            if self.started:
+                return
+            if self.closed:
+                raise RuntimeError("Token economy is closed")
+            if _importing_main_in_child():
+                raise RuntimeError("Shard workers cannot be started while a worker imports the main module")
+
+            # Exclusive for as long as the workers run; raises if another economy owns the state
+            self._shard_lock = acquire_shard_lock(self.data_dir)
+            try:
+                # The previous run may have used another shard count (or none at all)
+                balances = self._consolidate_shards()
+            except Exception:
+                release_shard_lock(self._shard_lock)
+                self._shard_lock = None
+                raise
+
+            partitions = [{} for _ in range(self.num_shards)]
+            for account, balance in balances.items():
+                partitions[self.shard_of(account)][account] = balance
+
+            context = multiprocessing.get_context()
+            for shard_id, partition in enumerate(partitions):
+                parent_conn, child_conn = context.Pipe()
+                shard_file = os.path.join(self.shards_dir, f"shard_{shard_id}.json")
+                worker = context.Process(
+                    target=_shard_worker,
+                    args=(child_conn, shard_file, partition, self.NETWORK_ADDRESS, self.persist),
+                    daemon=True
+                )
+                worker.start()
+                child_conn.close()
+                self.connections.append(parent_conn)
+                self.workers.append(worker)
+
+            self.started = True
+            atexit.register(self.close)
+
+    def shard_of(self, account):
+        """Return the shard that owns an account"""
+        return shard_for(account, self.num_shards)
+
+    def _save_meta(self):
+        """Persist coordinator state (distributed tokens)"""
+        if not self.persist:
+            return
+        try:
+            write_json_atomic(self.meta_file, {'total_distributed': self.total_distributed})
+        except Exception as e:
+            print(f"Error saving shard metadata: {e}")
+
+    def save_balances(self):
+        """Merge every shard into the balances JSON file"""
+        if not self.persist:
+            return
+        try:
+            self._write_balances(self.snapshot())
+        except Exception as e:
+            print(f"Error saving balances: {e}")
+
+    def _dispatch(self, ops_by_shard):
+        """Send operations to all shards in parallel and collect their results"""
+        with self._lock:
+            if not self.started:
+                self.start()
+
+            active = [shard_id for shard_id, ops in enumerate(ops_by_shard) if ops]
+            for shard_id in active:
+                self.connections[shard_id].send(('batch', ops_by_shard[shard_id]))
+
+            results = [[] for _ in ops_by_shard]
+            for shard_id in active:
+                results[shard_id], self._persisted[shard_id], error = self.connections[shard_id].recv()
+                if error:
+                    print(f"Shard {shard_id}: {error}")
+
+            # A decision can leave the log once every shard it touches has persisted it
+            self._pending_decisions = [
+                decision for decision in self._pending_decisions
+                if any(self._persisted[shard_id] < decision['id'] for shard_id in decision['shards'])
+            ]
+            return results
+
+    def _execute(self, transfers):
+        """
+        Run (sender, recipient, amount, create) transfers in sequence order
+        The batch is cut into rounds so that no transfer spends from an account
+        with a cross-shard transfer still in flight; every transfer is therefore
+        accepted or rejected exactly as TokenEconomy would in the same order
+        """
+        with self._lock:
+            if not self.started:
+                self.start()
+
+            results = [None] * len(transfers)
+            round_items, in_flight = [], set()
+            for seq, transfer in enumerate(transfers):
+                sender, recipient = transfer[0], transfer[1]
+                if sender in in_flight:
+                    self._execute_round(round_items, results)
+                    round_items, in_flight = [], set()
+
+                round_items.append((seq, transfer))
+                if sender != recipient and self.shard_of(sender) != self.shard_of(recipient):
+                    in_flight.update((sender, recipient))
+
+            if round_items:
+                self._execute_round(round_items, results)
+            return results
+
+    def _execute_round(self, items, results):
+        """Run one round of (seq, transfer) items through both phases, filling in results"""
+        phase_one = [[] for _ in range(self.num_shards)]
+        owners = [[] for _ in range(self.num_shards)]
+        cross_shard = []
+
+        for seq, (sender, recipient, amount, create) in items:
+            if sender == recipient:
+                results[seq] = (False, "Cannot send transaction to yourself")
+                continue
+
+            sender_shard = self.shard_of(sender)
+            recipient_shard = self.shard_of(recipient)
+            if sender_shard == recipient_shard:
+                phase_one[sender_shard].append(('transfer', sender, recipient, amount, create))
+                owners[sender_shard].append(('local', seq))
+            else:
+                self._txid += 1
+                txid = self._txid
+                phase_one[sender_shard].append(('prepare_debit', txid, sender, amount))
+                owners[sender_shard].append(('debit', seq))
+                phase_one[recipient_shard].append(('prepare_credit', txid, recipient, create))
+                owners[recipient_shard].append(('credit', seq))
+                cross_shard.append((seq, txid, sender_shard, recipient_shard, amount, sender, recipient))
+
+        # Phase one: local transfers are applied, cross-shard ones are prepared
+        votes = {}
+        for shard_id, shard_results in enumerate(self._dispatch(phase_one)):
+            for (role, seq), result in zip(owners[shard_id], shard_results):
+                if role == 'local':
+                    results[seq] = result
+                else:
+                    votes[(role, seq)] = result
+
+        if not cross_shard:
+            return
+
+        # Phase two: commit when both sides voted yes, otherwise abort
+        phase_two = [[] for _ in range(self.num_shards)]
+        commits = []
+        for seq, txid, sender_shard, recipient_shard, amount, sender, recipient in cross_shard:
+            debit_ok, debit_message = votes[('debit', seq)]
+            credit_ok, credit_message = votes[('credit', seq)]
+
+            if debit_ok and credit_ok:
+                phase_two[sender_shard].append(('commit_debit', txid))
+                phase_two[recipient_shard].append(('commit_credit', txid, amount))
+                commits.append([sender_shard, sender, recipient_shard, recipient, amount])
+                results[seq] = (True, "Transfer successful")
+                continue
+
+            if debit_ok:
+                phase_two[sender_shard].append(('abort_debit', txid))
+            if credit_ok:
+                phase_two[recipient_shard].append(('abort_credit', txid))
+
+            if not debit_ok and (debit_message == "Sender account not found" or credit_ok):
+                results[seq] = (False, debit_message)
+            else:
+                results[seq] = (False, credit_message)
+
+        if commits:
+            # Log the commit decision before any shard applies it, so recovery can finish phase two.
+            # Earlier decisions stay in the log until every shard involved has persisted them
+            self._decision_id += 1
+            decision = {
+                'id': self._decision_id,
+                'commits': commits,
+                'shards': sorted({commit[0] for commit in commits} | {commit[2] for commit in commits})
+            }
+            try:
+                if self.persist:
+                    write_json_atomic(self.decision_file, {'decisions': self._pending_decisions + [decision]})
+                    self._pending_decisions.append(decision)
+            except Exception as e:
+                print(f"Error saving commit decision: {e}")
+                for ops in phase_two:
+                    ops[:] = [('abort_' + op[0][len('commit_'):], op[1]) if op[0].startswith('commit_') else op
+                              for op in ops]
+                for seq in (item[0] for item in cross_shard):
+                    if results[seq][0]:
+                        results[seq] = (False, "Transfer could not be committed")
+            else:
+                for ops in phase_two:
+                    if any(op[0].startswith('commit_') for op in ops):
+                        ops.insert(0, ('decide', self._decision_id))
+
+        self._dispatch(phase_two)
+
+    def create_user_account(self, username):
+        """Create a new user account with initial balance"""
+        if username == self.NETWORK_ADDRESS:
+            return False, "User already exists"
+
+        with self._lock:
+            if not self.started:
+                self.start()
+            if self.total_distributed + self.INITIAL_USER_BALANCE > self.TOTAL_SUPPLY:
+                return False, "Insufficient network funds"
+
+            # Transfer from network to user, creating the account on its shard
+            success, message = self._execute(
+                [(self.NETWORK_ADDRESS, username, self.INITIAL_USER_BALANCE, True)]
+            )[0]
+            if not success:
+                return False, message
+
+            self.total_distributed += self.INITIAL_USER_BALANCE
+            self._save_meta()
+
+        return True, f"Account created with {self.INITIAL_USER_BALANCE} tokens"
+
+    def get_balance(self, username):
+        """Get user balance from its shard"""
+        shard_id = self.shard_of(username)
+        ops = [[] for _ in range(self.num_shards)]
+        ops[shard_id].append(('balance', username))
+        return self._dispatch(ops)[shard_id][0]
+
+    def transfer_tokens(self, sender, recipient, amount):
+        """Transfer tokens between users"""
+        return self._execute([(sender, recipient, amount, False)])[0]
+
+    def transfer_batch(self, transfers):
+        """Validate and apply (sender, recipient, amount) transfers across all shards"""
+        return self._execute([(sender, recipient, amount, False) for sender, recipient, amount in transfers])
+
+    def snapshot(self):
+        """Collect the balances of every shard"""
+        balances = {}
+        for shard_results in self._dispatch([[('snapshot',)] for _ in range(self.num_shards)]):
+            balances.update(shard_results[0])
+        return balances
+
+    def get_total_balance(self):
+        """Sum of all balances (equals TOTAL_SUPPLY while supply is conserved)"""
+        return sum(self.snapshot().values())
+
+    def get_network_stats(self):
+        """Get network statistics"""
+        active_accounts = 0
+        network_reserve = 0.0
+        for shard_results in self._dispatch([[('stats',)] for _ in range(self.num_shards)]):
+            accounts, reserve = shard_results[0]
+            active_accounts += accounts
+            if reserve is not None:
+                network_reserve = reserve
+
+        return {
+            'total_supply': self.TOTAL_SUPPLY,
+            'total_distributed': self.total_distributed,
+            'network_reserve': network_reserve,
+            'active_accounts': active_accounts,
+            'shards': self.num_shards
+        }
+
+    def close(self):
+        """Merge shard state into the balances file and stop the workers"""
+        with self._lock:
+            if not self.started or self.closed:
+                return
+
+            if self.persist:
+                # Shard files are only removed once balances.json is durably written
+                self._write_balances(self.snapshot(), sync=True)
+                clear_shard_state(self.shards_dir)
+
+            self.closed = True
+            for conn in self.connections:
+                conn.send(('stop', None))
+            for conn, worker in zip(self.connections, self.workers):
+                conn.recv()
+                conn.close()
+                worker.join()
+
+            # Workers inherited the lock file; release only once they have exited
+            release_shard_lock(self._shard_lock)
+            self._shard_lock = None
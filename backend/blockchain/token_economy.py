@@ -1,5 +1,7 @@
 import json
 import os
+from .shard_store import (acquire_shard_lock, clear_shard_state, has_shard_state, recover_shard_state,
+                          release_shard_lock, write_json_atomic)
 
 class TokenEconomy:
     """
@@ -12,17 +14,46 @@ class TokenEconomy:
     INITIAL_USER_BALANCE = 10.0
     NETWORK_ADDRESS = "NETWORK"
     
-    def __init__(self):
-        self.data_dir = "data"
+    def __init__(self, data_dir="data", persist=True):
+        self.data_dir = data_dir
+        self.persist = persist
         self.balances_file = os.path.join(self.data_dir, "balances.json")
+        self.shards_dir = os.path.join(self.data_dir, "shards")
         
         # Ensure data directory exists
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Load existing balances or initialize
+        # Load existing balances (including state left by a sharded run) or initialize
         self.balances, self.total_distributed = self.load_balances()
+        if has_shard_state(self.shards_dir):
+            self.balances = self.consolidate_shards()
     
     def load_balances(self):
+        """Load balances from JSON file, merged with any leftover shard state"""
+        balances, total_distributed = self._load_balances_file()
+        if has_shard_state(self.shards_dir):
+            balances, total_distributed = recover_shard_state(self.shards_dir, balances, total_distributed)
+        return balances, total_distributed
+    
+    def consolidate_shards(self):
+        """Fold leftover shard state into balances.json, then drop the shard files"""
+        # Refuses (raises) while a sharded economy is running on this data directory
+        lock = acquire_shard_lock(self.data_dir)
+        try:
+            return self._consolidate_shards()
+        finally:
+            release_shard_lock(lock)
+    
+    def _consolidate_shards(self):
+        """Reload balances and merge shard state; the caller holds the shard lock"""
+        balances, self.total_distributed = self.load_balances()
+        if has_shard_state(self.shards_dir):
+            # Raises on failure, so shard files are only removed after a durable write
+            self._write_balances(balances, sync=True)
+            clear_shard_state(self.shards_dir)
+        return balances
+    
+    def _load_balances_file(self):
         """Load balances from JSON file"""
         if os.path.exists(self.balances_file):
             try:
@@ -42,17 +73,22 @@ class TokenEconomy:
         # Initialize with full supply in network
         return {self.NETWORK_ADDRESS: self.TOTAL_SUPPLY}, 0.0
     
+    def _write_balances(self, balances, sync=False):
+        """Atomically write balances to JSON file"""
+        data = {
+            'balances': balances,
+            'total_distributed': self.total_distributed,
+            'total_supply': self.TOTAL_SUPPLY,
+            'initial_user_balance': self.INITIAL_USER_BALANCE
+        }
+        write_json_atomic(self.balances_file, data, sync=sync, indent=2)
+    
     def save_balances(self):
         """Save balances to JSON file"""
+        if not self.persist:
+            return
         try:
-            data = {
-                'balances': self.balances,
-                'total_distributed': self.total_distributed,
-                'total_supply': self.TOTAL_SUPPLY,
-                'initial_user_balance': self.INITIAL_USER_BALANCE
-            }
-            with open(self.balances_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            self._write_balances(self.balances)
         except Exception as e:
             print(f"Error saving balances: {e}")
     
@@ -80,6 +116,16 @@ class TokenEconomy:
     
     def transfer_tokens(self, sender, recipient, amount):
         """Transfer tokens between users"""
+        success, message = self._apply_transfer(sender, recipient, amount)
+        
+        # Persist changes
+        if success:
+            self.save_balances()
+        
+        return success, message
+    
+    def _apply_transfer(self, sender, recipient, amount):
+        """Validate and apply a transfer in memory, without persisting it"""
         if sender == recipient:
             return False, "Cannot send transaction to yourself"
         
@@ -99,11 +145,18 @@ class TokenEconomy:
         self.balances[sender] -= amount
         self.balances[recipient] += amount
         
-        # Persist changes
-        self.save_balances()
-        
         return True, "Transfer successful"
     
+    def transfer_batch(self, transfers):
+        """Validate and apply (sender, recipient, amount) transfers in order, saving once"""
+        results = [self._apply_transfer(sender, recipient, amount) for sender, recipient, amount in transfers]
+        
+        # Group commit: one balances write for the whole batch
+        if any(success for success, _ in results):
+            self.save_balances()
+        
+        return results
+    
     def get_network_stats(self):
         """Get network statistics"""
         return {
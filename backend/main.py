@@ -1,13 +1,19 @@
+import os
+import sys
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from blockchain.blockchain import Blockchain
 from api.auth import register as register_user, login as login_user
-from api.wallet import transfer_funds, get_user_balance, get_user_transaction_history
+from api.wallet import transfer_funds, transfer_funds_batch, get_user_balance, get_user_transaction_history
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 blockchain = Blockchain()
 
+# The api modules look the instance up with "from main import blockchain"; when this
+# file runs as a script, point "main" here instead of importing it a second time
+sys.modules.setdefault('main', sys.modules[__name__])
+
 @app.route('/register', methods=['POST'])
 def register():
     data = request.json
@@ -30,6 +36,11 @@ def transfer():
     amount = data.get('amount')
     return transfer_funds(sender, recipient, amount)
 
+@app.route('/transfer/batch', methods=['POST'])
+def transfer_batch():
+    data = request.json
+    return transfer_funds_batch(data.get('transfers'))
+
 @app.route('/balance/<username>', methods=['GET'])
 def get_balance(username):
     return get_user_balance(username)
@@ -92,5 +103,26 @@ def reload_blockchain():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/debug/compact', methods=['POST'])
+def compact_blockchain():
+    """Roll old blocks into compressed archive segments"""
+    try:
+        data = request.get_json(silent=True) or {}
+        report = blockchain.compact_archive(
+            segment_size=int(data.get('segment_size', blockchain.archive.DEFAULT_SEGMENT_SIZE)),
+            keep_recent=int(data.get('keep_recent', blockchain.archive.DEFAULT_KEEP_RECENT)),
+            codec=data.get('codec', 'zlib')
+        )
+        return jsonify(report), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
+    # Start shard workers before the server creates request threads. With the debug
+    # reloader this file also runs in the watcher process, which never serves requests
+    # and so must not claim the shard state
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        blockchain.start()
     app.run(debug=True)
\ No newline at end of file
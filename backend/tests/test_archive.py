@@ -0,0 +1,95 @@
+import json
+import os
+import pytest
+from blockchain.blockchain import Blockchain
+
+
+def build_chain(blockchain, length):
+    """Append hash-linked blocks until the chain has the given length"""
+    while len(blockchain.chain) < length:
+        blockchain.current_transactions = [{'sender': 'NETWORK', 'recipient': f'user{len(blockchain.chain)}',
+                                            'amount': 1.0}]
+        blockchain.create_block(proof=len(blockchain.chain), previous_hash=blockchain.hash(blockchain.last_block))
+
+
+@pytest.fixture
+def blockchain(tmp_path, monkeypatch):
+    # Blockchain keeps its data in ./data
+    monkeypatch.chdir(tmp_path)
+    blockchain = Blockchain(shards=1)
+    build_chain(blockchain, 30)
+    return blockchain
+
+
+def test_compact_archives_sealed_ranges(blockchain):
+    report = blockchain.compact_archive(segment_size=10, keep_recent=5)
+
+    assert report['segments_created'] == 2
+    assert report['blocks_archived'] == 20
+    assert report['total_archived_blocks'] == 20
+    assert report['bytes_reclaimed'] > 0
+
+    with open(blockchain.blockchain_file, 'r', encoding='utf-8') as f:
+        hot = json.load(f)['chain']
+    assert [block['index'] for block in hot] == list(range(21, 31))
+
+
+def test_reload_reads_archived_blocks(blockchain):
+    chain = list(blockchain.chain)
+    blockchain.compact_archive(segment_size=10, keep_recent=5)
+
+    reloaded = Blockchain(shards=1)
+    assert reloaded.chain == chain
+    assert reloaded.archive.get_block(7) == chain[6]
+    assert reloaded.archive.get_block(21) is None
+
+
+def test_rebuild_missing_index(blockchain):
+    chain = list(blockchain.chain)
+    blockchain.compact_archive(segment_size=10, keep_recent=5)
+    os.remove(blockchain.archive.index_file)
+
+    reloaded = Blockchain(shards=1)
+    assert reloaded.chain == chain
+    assert os.path.exists(reloaded.archive.index_file)
+    assert [segment['end_index'] for segment in reloaded.archive.segments] == [10, 20]
+    assert all(reloaded.archive.verify_segment(segment) for segment in reloaded.archive.segments)
+
+
+def test_rebuild_corrupt_index(blockchain):
+    chain = list(blockchain.chain)
+    blockchain.compact_archive(segment_size=10, keep_recent=5)
+    with open(blockchain.archive.index_file, 'w', encoding='utf-8') as f:
+        f.write('{"segments": [')
+
+    reloaded = Blockchain(shards=1)
+    assert reloaded.chain == chain
+    with open(reloaded.archive.index_file, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['segments']) == 2
+
+
+def test_rebuild_rejects_missing_segment(blockchain):
+    blockchain.compact_archive(segment_size=10, keep_recent=5)
+    os.remove(os.path.join(blockchain.archive.archive_dir, blockchain.archive.segments[0]['file']))
+    os.remove(blockchain.archive.index_file)
+
+    with pytest.raises(ValueError):
+        Blockchain(shards=1)
+
+
+def test_compact_keeps_indexed_segments_when_directory_sync_fails(blockchain, monkeypatch):
+    archive = blockchain.archive
+    calls = []
+
+    def failing_fsync_dir():
+        calls.append(True)
+        # Segment writes succeed; the sync after the index replace fails
+        if len(calls) > 2:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(archive, '_fsync_dir', failing_fsync_dir)
+    with pytest.raises(OSError):
+        archive.compact(blockchain.chain, segment_size=10, keep_recent=5)
+
+    assert [segment['end_index'] for segment in archive.segments] == [10, 20]
+    assert all(archive.verify_segment(segment) for segment in archive.segments)
@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import pytest
+from blockchain.shard_store import DECISION_FILE, META_FILE, has_shard_state, release_shard_lock
+from blockchain.sharded_economy import ShardedTokenEconomy, shard_for
+from blockchain.token_economy import TokenEconomy
+
+ACCOUNTS = [f"user{i}" for i in range(20)]
+
+
+def seed_balances(data_dir, accounts=ACCOUNTS, balance=100.0):
+    total_distributed = len(accounts) * balance
+    balances = {TokenEconomy.NETWORK_ADDRESS: TokenEconomy.TOTAL_SUPPLY - total_distributed}
+    balances.update({account: balance for account in accounts})
+    with open(os.path.join(data_dir, "balances.json"), 'w', encoding='utf-8') as f:
+        json.dump({'balances': balances, 'total_distributed': total_distributed}, f)
+    return balances
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def crash(economy):
+    """Stop the workers without consolidating, as if the process had been killed"""
+    for worker in economy.workers:
+        worker.terminate()
+        worker.join()
+    release_shard_lock(economy._shard_lock)
+    economy.closed = True
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    seed_balances(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_replays_decision_after_phase_two_crash(data_dir):
+    sender = next(account for account in ACCOUNTS if shard_for(account, 2) == 0)
+    recipient = next(account for account in ACCOUNTS if shard_for(account, 2) == 1)
+
+    # Shard 0 persisted the debit of decision 1, shard 1 crashed before crediting it
+    shards_dir = os.path.join(data_dir, "shards")
+    os.makedirs(shards_dir)
+    write_json(os.path.join(shards_dir, "shard_0.json"), {'balances': {sender: 60.0}, 'decision_id': 1})
+    write_json(os.path.join(shards_dir, "shard_1.json"), {'balances': {recipient: 100.0}, 'decision_id': 0})
+    write_json(os.path.join(shards_dir, META_FILE), {'total_distributed': len(ACCOUNTS) * 100.0})
+    write_json(os.path.join(shards_dir, DECISION_FILE),
+               {'decisions': [{'id': 1, 'commits': [[0, sender, 1, recipient, 40.0]], 'shards': [0, 1]}]})
+
+    economy = TokenEconomy(data_dir)
+    assert economy.get_balance(sender) == 60.0
+    assert economy.get_balance(recipient) == 140.0
+    assert sum(economy.balances.values()) == TokenEconomy.TOTAL_SUPPLY
+    assert not has_shard_state(shards_dir)
+
+    # The consolidated state is durable
+    assert TokenEconomy(data_dir).balances == economy.balances
+
+
+def test_consolidates_after_restart_with_different_shard_count(data_dir):
+    rng = random.Random(1)
+    transfers = [(rng.choice(ACCOUNTS), rng.choice(ACCOUNTS), float(rng.randint(1, 50))) for _ in range(200)]
+    reference = TokenEconomy(data_dir, persist=False)
+    expected = reference.transfer_batch(transfers)
+
+    economy = ShardedTokenEconomy(data_dir, 4)
+    assert economy.transfer_batch(transfers[:100]) == expected[:100]
+    crash(economy)
+
+    restarted = ShardedTokenEconomy(data_dir, 3)
+    try:
+        assert restarted.transfer_batch(transfers[100:]) == expected[100:]
+        assert restarted.snapshot() == reference.balances
+    finally:
+        restarted.close()
+
+    assert not has_shard_state(os.path.join(data_dir, "shards"))
+    assert TokenEconomy(data_dir).balances == reference.balances
+
+
+@pytest.mark.parametrize('num_shards', [2, 3, 8])
+def test_batch_results_match_unsharded_economy(data_dir, num_shards):
+    rng = random.Random(num_shards)
+    accounts = ACCOUNTS + ['ghost']
+    # Large amounts make later transfers depend on credits received earlier in the batch
+    transfers = [(rng.choice(accounts), rng.choice(accounts), float(rng.randint(1, 150))) for _ in range(300)]
+    reference = TokenEconomy(data_dir, persist=False)
+
+    economy = ShardedTokenEconomy(data_dir, num_shards)
+    try:
+        assert economy.transfer_batch(transfers) == reference.transfer_batch(transfers)
+        assert economy.get_total_balance() == TokenEconomy.TOTAL_SUPPLY
+    finally:
+        economy.close()
+
+
+def test_second_economy_refuses_locked_shard_state(data_dir):
+    economy = ShardedTokenEconomy(data_dir, 2)
+    try:
+        assert economy.transfer_tokens(ACCOUNTS[0], ACCOUNTS[1], 10.0) == (True, "Transfer successful")
+        with pytest.raises(RuntimeError):
+            ShardedTokenEconomy(data_dir, 2).start()
+        # Consolidating the running economy's shard files is refused as well
+        with pytest.raises(RuntimeError):
+            TokenEconomy(data_dir)
+    finally:
+        economy.close()